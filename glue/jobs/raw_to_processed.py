@@ -10,27 +10,61 @@ from awsglue.transforms import *
 from awsglue.utils import getResolvedOptions
 from awsglue.context import GlueContext
 from awsglue.job import Job
-from awsglue.dynamicframe import DynamicFrame
 
+from pyspark import SparkConf, StorageLevel
 from pyspark.context import SparkContext
 from pyspark.sql import functions as F
-from pyspark.sql.window import Window
-
+from pyspark.sql.types import StringType
+
+
+# Executor-level settings must be in place before the context starts:
+# compress shuffle and spill files with LZ4, buffer shuffle writes more
+# generously, and move execution memory off-heap to cut GC pauses during
+# the dedup shuffle
+conf = (
+    SparkConf()
+    .set("spark.shuffle.compress", "true")
+    .set("spark.shuffle.spill.compress", "true")
+    .set("spark.io.compression.codec", "lz4")
+    .set("spark.shuffle.file.buffer", "96k")
+    .set("spark.memory.offHeap.enabled", "true")
+    .set("spark.memory.offHeap.size", "2g")
+    # EMRFS S3-optimized committer: commit via completed multipart
+    # uploads instead of one copy+delete rename per output file
+    .set("spark.sql.parquet.output.committer.class",
+         "com.amazon.emr.committer.EmrOptimizedSparkSqlParquetOutputCommitter")
+    .set("spark.sql.parquet.fs.optimized.committer.optimization-enabled", "true")
+    .set("mapreduce.fileoutputcommitter.algorithm.version", "2")
+)
 
 # Initialize Glue context
-sc = SparkContext()
+sc = SparkContext(conf=conf)
 glueContext = GlueContext(sc)
 spark = glueContext.spark_session
 job = Job(glueContext)
 
-# Get job parameters
-args = getResolvedOptions(sys.argv, [
+# Adaptive query execution: coalesce small post-shuffle partitions at
+# runtime and split skewed ones, so the dedup shuffle is sized by data
+# rather than a fixed spark.sql.shuffle.partitions
+spark.conf.set("spark.sql.adaptive.enabled", "true")
+spark.conf.set("spark.sql.adaptive.coalescePartitions.enabled", "true")
+spark.conf.set("spark.sql.adaptive.advisoryPartitionSizeInBytes", "128m")
+spark.conf.set("spark.sql.adaptive.skewJoin.enabled", "true")
+
+# Safety cap so a single output task never produces an oversized file
+spark.conf.set("spark.sql.files.maxRecordsPerFile", "2000000")
+
+# Get job parameters; ingest_date (YYYY-MM-DD) is optional and limits the
+# read to a single raw partition instead of a full-table scan
+required_args = [
     'JOB_NAME',
     'source_database',
     'source_table',
     'target_bucket',
     'target_prefix'
-])
+]
+optional_args = ['ingest_date'] if '--ingest_date' in sys.argv else []
+args = getResolvedOptions(sys.argv, required_args + optional_args)
 
 job.init(args['JOB_NAME'], args)
 
@@ -39,107 +73,143 @@ SOURCE_DATABASE = args['source_database']
 SOURCE_TABLE = args['source_table']
 TARGET_BUCKET = args['target_bucket']
 TARGET_PREFIX = args['target_prefix']
+INGEST_DATE = args.get('ingest_date')
+JOB_RUN_ID = args.get('JOB_RUN_ID', 'local')
+
+
+def build_partition_predicate(ingest_date):
+    """Build a catalog push-down predicate for a YYYY-MM-DD ingest date"""
+    dt = datetime.strptime(ingest_date, '%Y-%m-%d')
+    return f"year={dt.year} AND month={dt.month} AND day={dt.day}"
 
 
 def read_raw_data():
     """Read data from Glue Data Catalog"""
     print(f"Reading from {SOURCE_DATABASE}.{SOURCE_TABLE}")
-    
+
+    # With job bookmarks enabled (--job-bookmark-option
+    # job-bookmark-enable), the stable transformation_ctx below lets Glue
+    # skip files already processed by a previous successful run;
+    # boundedFiles caps catch-up runs so a backlog never lands in one job
+    read_kwargs = {
+        'additional_options': {'boundedFiles': '1000'}
+    }
+    if INGEST_DATE:
+        # Partition pruning: only list and read S3 objects for the
+        # requested date instead of scanning the whole raw table
+        predicate = build_partition_predicate(INGEST_DATE)
+        print(f"Applying partition predicate: {predicate}")
+        read_kwargs['push_down_predicate'] = predicate
+
     dynamic_frame = glueContext.create_dynamic_frame.from_catalog(
         database=SOURCE_DATABASE,
         table_name=SOURCE_TABLE,
-        transformation_ctx="read_raw"
+        transformation_ctx="read_raw",
+        **read_kwargs
     )
-    
-    return dynamic_frame.toDF()
 
+    return dynamic_frame.toDF()
 
-def clean_data(df):
-    """Apply data cleaning transformations"""
-    print("Applying data cleaning...")
-    
-    cleaned = df
-    
-    # Drop duplicates based on primary key and timestamp
-    if 'id' in df.columns and 'timestamp' in df.columns:
-        window = Window.partitionBy('id').orderBy(F.desc('timestamp'))
-        cleaned = (
-            cleaned
-            .withColumn('row_num', F.row_number().over(window))
-            .filter(F.col('row_num') == 1)
-            .drop('row_num')
-        )
-    
-    # Trim string columns
-    string_cols = [f.name for f in df.schema.fields if str(f.dataType) == 'StringType']
-    for col_name in string_cols:
-        cleaned = cleaned.withColumn(col_name, F.trim(F.col(col_name)))
-    
-    # Handle nulls in critical columns
-    cleaned = cleaned.na.drop(subset=['id']) if 'id' in df.columns else cleaned
-    
-    return cleaned
 
+def build_transform(df):
+    """Apply cleaning, audit and partition columns in a single projection"""
+    print("Applying transformations...")
 
-def add_audit_columns(df):
-    """Add audit and metadata columns"""
-    print("Adding audit columns...")
-    
-    return (
-        df
-        .withColumn('_processed_at', F.current_timestamp())
-        .withColumn('_source_file', F.input_file_name())
-        .withColumn('_job_run_id', F.lit(args['JOB_RUN_ID'] if 'JOB_RUN_ID' in args else 'local'))
-    )
+    # Capture the source file while rows are still in the scan stage;
+    # input_file_name() returns an empty string once they cross a shuffle
+    transformed = df.withColumn('_source_file', F.input_file_name())
+    carried_cols = df.columns + ['_source_file']
 
+    # Handle nulls in critical columns
+    if 'id' in df.columns:
+        transformed = transformed.na.drop(subset=['id'])
+
+    # Drop duplicates based on primary key and timestamp. groupBy with a
+    # max(struct) keeps the latest record per id using a map-side partial
+    # aggregate, where a row_number window would force a full sort of
+    # every key's rows after the shuffle. _source_file rides in the
+    # struct so the surviving row keeps the file it actually came from.
+    if 'id' in df.columns and 'timestamp' in df.columns:
+        value_cols = ['timestamp'] + [c for c in carried_cols if c not in ('id', 'timestamp')]
+        transformed = (
+            transformed
+            .groupBy('id')
+            .agg(F.max(F.struct(*value_cols)).alias('_latest'))
+            .select(*[
+                F.col('id') if c == 'id' else F.col(f'_latest.{c}').alias(c)
+                for c in carried_cols
+            ])
+        )
 
-def add_partitions(df):
-    """Add partition columns for efficient querying"""
-    print("Adding partition columns...")
-    
-    # If timestamp exists, create date partitions
+    # Build every derived column in one select: trimmed strings, audit
+    # metadata and partition columns. One Project node keeps the Catalyst
+    # plan flat instead of stacking a withColumn per derived column.
+    string_cols = {f.name for f in df.schema.fields if isinstance(f.dataType, StringType)}
+    projection = [
+        F.trim(F.col(c)).alias(c) if c in string_cols else F.col(c)
+        for c in df.columns
+    ]
+
+    # Audit and metadata columns
+    projection += [
+        F.current_timestamp().alias('_processed_at'),
+        F.col('_source_file'),
+        F.lit(JOB_RUN_ID).alias('_job_run_id'),
+    ]
+
+    # Partition columns: event date if available, else processing date
     if 'timestamp' in df.columns:
-        return (
-            df
-            .withColumn('year', F.year(F.col('timestamp')))
-            .withColumn('month', F.month(F.col('timestamp')))
-            .withColumn('day', F.dayofmonth(F.col('timestamp')))
-        )
+        projection += [
+            F.year(F.col('timestamp')).alias('year'),
+            F.month(F.col('timestamp')).alias('month'),
+            F.dayofmonth(F.col('timestamp')).alias('day'),
+        ]
     else:
-        # Use processing date for partitions
         now = datetime.utcnow()
-        return (
-            df
-            .withColumn('year', F.lit(now.year))
-            .withColumn('month', F.lit(now.month))
-            .withColumn('day', F.lit(now.day))
-        )
+        projection += [
+            F.lit(now.year).alias('year'),
+            F.lit(now.month).alias('month'),
+            F.lit(now.day).alias('day'),
+        ]
+
+    return transformed.select(*projection)
 
 
 def write_processed_data(df):
     """Write data to processed zone as Parquet"""
     output_path = f"s3://{TARGET_BUCKET}/{TARGET_PREFIX}"
     print(f"Writing to {output_path}")
-    
-    # Convert to DynamicFrame
-    dynamic_frame = DynamicFrame.fromDF(df, glueContext, "processed")
-    
-    # Write with partitioning
-    glueContext.write_dynamic_frame.from_options(
-        frame=dynamic_frame,
-        connection_type="s3",
-        format="glueparquet",
-        connection_options={
-            "path": output_path,
-            "partitionKeys": ["year", "month", "day"]
-        },
-        format_options={
-            "compression": "snappy"
-        },
-        transformation_ctx="write_processed"
+
+    # Persist so the count and the write share a single execution of the DAG
+    df.persist(StorageLevel.DISK_ONLY)
+    row_count = df.count()
+
+    # Right-size output files instead of inheriting the upstream shuffle
+    # partition count (typically 200 near-empty tasks): target ~1M rows
+    # per file. Round-robin repartition only — hashing on year/month/day
+    # would put a whole day in one task, and partitionBy already splits
+    # the output directories.
+    target_files = max(1, row_count // 1_000_000)
+    out = df.repartition(target_files)
+
+    # Write with Spark's native columnar Parquet writer; converting to a
+    # DynamicFrame would box every row through Glue's Python record path
+    # Bloom filter on the primary key lets Athena/Glue readers skip row
+    # groups on point lookups; page indexes (column min/max) come free
+    # with the parquet-mr version Glue 4.0 ships
+    (
+        out.write
+        .option("compression", "snappy")
+        .option("parquet.bloom.filter.enabled#id", "true")
+        .option("parquet.bloom.filter.expected.ndv#id", "1000000")
+        .partitionBy("year", "month", "day")
+        .mode("append")
+        .parquet(output_path)
     )
-    
-    return df.count()
+
+    df.unpersist()
+
+    return row_count
 
 
 def update_catalog(row_count):
@@ -162,15 +232,12 @@ def main():
     
     # Read
     raw_df = read_raw_data()
-    print(f"Read {raw_df.count()} raw records")
-    
+
     # Transform
-    cleaned_df = clean_data(raw_df)
-    with_audit = add_audit_columns(cleaned_df)
-    with_partitions = add_partitions(with_audit)
-    
+    transformed_df = build_transform(raw_df)
+
     # Write
-    row_count = write_processed_data(with_partitions)
+    row_count = write_processed_data(transformed_df)
     
     # Update catalog
     update_catalog(row_count)
@@ -229,6 +229,7 @@ resource "aws_glue_job" "raw_to_processed" {
     "--source_table"              = "raw_data"
     "--target_bucket"             = aws_s3_bucket.processed.id
     "--target_prefix"             = "processed/"
+    "--job-bookmark-option"       = "job-bookmark-enable"
     "--enable-metrics"            = "true"
     "--enable-continuous-cloudwatch-log" = "true"
     "--job-language"              = "python"